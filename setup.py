@@ -26,7 +26,6 @@ project_dir  = dirname(realpath(__file__))
 reqs = (
     'kwexception',
     'pyperclip',
-    'short-con',
 )
 
 extras = {
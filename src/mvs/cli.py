@@ -6,10 +6,11 @@ import sys
 import traceback
 
 from datetime import datetime
+from functools import lru_cache
 from io import StringIO
+from itertools import islice
 from pathlib import Path
-from textwrap import dedent
-from short_con import constants
+from types import MappingProxyType
 
 from .plan import RenamingPlan
 from .problems import Problem, CONTROLS
@@ -21,6 +22,7 @@ from .utils import (
     MvsError,
     PrefType,
     STRUCTURES,
+    constants,
     list_of_str,
     list_or_str,
     posint_pref,
@@ -151,7 +153,7 @@ class CliRenamer:
             return
 
         # Print the renaming listing.
-        listing = self.listing_msg(MF.paths_to_be_renamed, plan.rps)
+        listing = self.listing_chunks(MF.paths_to_be_renamed, plan.rps)
         self.paginate(listing)
 
         # Stop if dryrun mode.
@@ -216,8 +218,8 @@ class CliRenamer:
     ####
 
     def parse_command_line_args(self):
-        # Create the parser.
-        ap = self.create_arg_parser()
+        # Get the parser.
+        ap = get_arg_parser()
 
         # Use argparse to parse self.args.
         #
@@ -347,28 +349,6 @@ class CliRenamer:
     def user_prefs_path(self):
         return self.app_directory / CON.prefs_file_name
 
-    def create_arg_parser(self):
-        # Define parser.
-        ap = argparse.ArgumentParser(
-            prog = CON.app_name,
-            description = CLI.description,
-            add_help = False,
-        )
-        # Add arguments, in argument-groups.
-        # The presense of CLI.group in the configuration dict (oc)
-        # signals the start of each new argument-group.
-        arg_group = None
-        for oc in CLI.opts_config:
-            kws = dict(oc)
-            kws.pop(CLI.dtype)
-            kws.pop(CLI.real_default, None)
-            if CLI.group in kws:
-                arg_group = ap.add_argument_group(kws.pop(CLI.group))
-            xs = kws.pop(CLI.names).split()
-            arg_group.add_argument(*xs, **kws)
-        # Return parser.
-        return ap
-
     def validate_sources_structures(self, opts):
         # Define the checks:
         # - Exactly one source for input paths.
@@ -380,11 +360,14 @@ class CliRenamer:
 
         # Run the checks.
         for opt_names, zero_ok in checks:
-            # N of sources or structures used.
-            n = len(tuple(
-                nm for nm in opt_names
-                if getattr(opts, nm, None)
-            ))
+            # N of sources or structures used. We can stop
+            # counting once we know there are too many.
+            n = 0
+            for nm in opt_names:
+                if getattr(opts, nm, None):
+                    n += 1
+                    if n > 1:
+                        break
 
             # If there is a problem, first set the problem msg.
             if n == 0 and not zero_ok:
@@ -397,7 +380,7 @@ class CliRenamer:
 
             # And then wrapup with the problem message.
             choices = CON.comma_join.join(
-                ('' if nm == CLI.sources.paths else CON.dash) + nm
+                CLI.flags[nm]
                 for nm in opt_names
             )
             msg = f'{msg}: {choices}'
@@ -425,24 +408,32 @@ class CliRenamer:
     ####
 
     def collect_input_paths(self):
-        # Gets the input path text from the source.
+        # Gets the input path lines from the source.
         # Returns a tuple of stripped lines.
         opts = self.opts
 
-        # Read the input path text from the initial source.
-        if opts.paths:
-            text = CON.newline.join(opts.paths)
-        else:
-            try:
-                if opts.clipboard:
-                    text = read_from_clipboard()
-                elif opts.file:
-                    text = read_from_file(opts.file)
-                else:
-                    text = self.stdin.read()
-            except Exception as e: # pragma: no cover
-                self.wrapup_with_tb(MF.path_collection_failed)
-                return None
+        # Read the input path lines from the initial source. Files and
+        # stdin are consumed line by line, rather than reading everything
+        # into one str and then splitting it. Text from other sources is
+        # split on newlines only, like files and stdin, not with
+        # str.splitlines(), which also splits on other characters.
+        # Stripping removes any carriage returns.
+        try:
+            if opts.paths:
+                lines = opts.paths
+            elif opts.clipboard:
+                lines = read_from_clipboard().split(CON.newline)
+            elif opts.file:
+                lines = read_from_file(opts.file)
+            else:
+                lines = self.stdin
+            paths = tuple(line.strip() for line in lines)
+        except MvsError as e:
+            self.wrapup(CON.exit_fail, e.msg)
+            return None
+        except Exception as e: # pragma: no cover
+            self.wrapup_with_tb(MF.path_collection_failed)
+            return None
 
         # If the user wants to use an editor, run the text through that process.
         if opts.edit:
@@ -450,14 +441,13 @@ class CliRenamer:
                 self.wrapup(CON.exit_fail, MF.no_editor)
                 return None
             try:
-                text = edit_text(opts.editor, text)
+                text = edit_text(opts.editor, CON.newline.join(paths))
             except Exception as e:
                 self.wrapup_with_tb(MF.edit_failed_unexpected)
                 return None
+            paths = tuple(line.strip() for line in text.split(CON.newline))
 
-        # Split, strip, return.
-        paths = text.split(CON.newline)
-        return tuple(path.strip() for path in paths)
+        return paths
 
     ####
     # Logging.
@@ -534,23 +524,35 @@ class CliRenamer:
         # Takes a message format and a sequence of items.
         # Returns a message-with-counts followed by a potentially-limited
         # listing of those items.
-        msg = self.msg_with_counts(fmt, xs)
-        items = CON.newline.join(x.formatted for x in xs[0:self.opts.limit])
-        return f'{msg}\n{items}'
-
-    def paginate(self, text):
-        # Takes some text and either send it to the
-        # configured pager or writes it to self.stdout.
+        return ''.join(self.listing_chunks(fmt, xs))
+
+    def listing_chunks(self, fmt, xs):
+        # Like listing_msg(), but yields the text in chunks so that
+        # large listings can be written out without first building
+        # the entire text in memory.
+        # The header always ends with a newline, even if there are
+        # no items. The items are separated by newlines.
+        yield self.msg_with_counts(fmt, xs)
+        yield CON.newline
+        for i, x in enumerate(islice(xs, self.opts.limit)):
+            if i:
+                yield CON.newline
+            yield x.formatted
+
+    def paginate(self, chunks):
+        # Takes an iterable of text chunks and either sends them to the
+        # configured pager or writes them to self.stdout.
         if self.opts.pager:
             p = subprocess.Popen(
                 self.opts.pager,
                 stdin = subprocess.PIPE,
                 shell = True,
             )
-            p.stdin.write(text.encode(CON.encoding))
+            for text in chunks:
+                p.stdin.write(text.encode(CON.encoding))
             p.communicate()
         else:
-            self.stdout.write(text)
+            self.stdout.writelines(chunks)
 
     ####
     # Other.
@@ -558,8 +560,10 @@ class CliRenamer:
 
     def get_confirmation(self, prompt, expected = 'y'):
         # Gets comfirmation from the command-line user.
+        # The prompt lacks a newline, so flush before waiting for the reply.
         msg = prompt + f' [{expected}]? '
         self.stdout.write(msg)
+        self.stdout.flush()
         reply = self.stdin.readline().lower().strip()
         return reply == expected
 
@@ -585,92 +589,93 @@ class CLI:
     sources = constants('Sources', ('paths', 'stdin', 'file', 'clipboard'))
     structures = constants('Structures', ('rename',) + STRUCTURES.keys())
 
-    # Program help text: description and explanatory text.
+    # Program help text: description and explanatory text. The texts
+    # are written without indentation, so no dedenting is needed.
 
-    description = dedent('''
-        Renames file and directory paths in bulk, via user-supplied
-        Python code or a data source mapping old paths to new paths.
-        No renaming occurs until all of the proposed changes have
-        been checked for common types of problems.
-    ''')
+    description = '''
+Renames file and directory paths in bulk, via user-supplied
+Python code or a data source mapping old paths to new paths.
+No renaming occurs until all of the proposed changes have
+been checked for common types of problems.
+'''
 
-    post_epilog = dedent('''
-        User-supplied code
-        ------------------
+    post_epilog = '''\
+User-supplied code
+------------------
 
-        The user-supplied renaming and filtering code receives the following
-        variables as function arguments:
+The user-supplied renaming and filtering code receives the following
+variables as function arguments:
 
-          o     Original path.
-          p     Original path, as a pathlib.Path instance.
-          seq   Current sequence value.
-          plan  RenamingPlan instance.
+  o     Original path.
+  p     Original path, as a pathlib.Path instance.
+  seq   Current sequence value.
+  plan  RenamingPlan instance.
 
-        The code also has access to these Python libraries or classes:
+The code also has access to these Python libraries or classes:
 
-          re    Python re library.
-          Path  Python pathlib.Path class.
+  re    Python re library.
+  Path  Python pathlib.Path class.
 
-        The RenamingPlan provides the strip_prefix() method, which takes a str
-        (presumably the original path) and returns a new str with the common
-        prefix (across all original paths) removed.
+The RenamingPlan provides the strip_prefix() method, which takes a str
+(presumably the original path) and returns a new str with the common
+prefix (across all original paths) removed.
 
-        User-supplied code should explictly return a value, as follows:
+User-supplied code should explictly return a value, as follows:
 
-          Renaming   New path, as a str or Path.
-          Filtering  True to retain original path, False to reject
+  Renaming   New path, as a str or Path.
+  Filtering  True to retain original path, False to reject
 
-        The code text does not require indentation for its first line,
-        but does require it for any subsequent lines.
+The code text does not require indentation for its first line,
+but does require it for any subsequent lines.
 
-        For reference, here are some useful Path components in a renaming
-        context:
+For reference, here are some useful Path components in a renaming
+context:
 
-          p         Path('/parent/dir/foo-bar.fubb')
-          p.parent  Path('/parent/dir')
-          p.name    'foo-bar.fubb'
-          p.step    'foo-bar'
-          p.suffix  '.fubb'
+  p         Path('/parent/dir/foo-bar.fubb')
+  p.parent  Path('/parent/dir')
+  p.name    'foo-bar.fubb'
+  p.step    'foo-bar'
+  p.suffix  '.fubb'
 
-        Problem control
-        ---------------
+Problem control
+---------------
 
-        Before any renaming occurs, each pair of original and new paths is
-        checked for common types of problems. By default, if any occur, the
-        renaming plan is halted and no paths are renamed. The problems and
-        their short names are as follows:
+Before any renaming occurs, each pair of original and new paths is
+checked for common types of problems. By default, if any occur, the
+renaming plan is halted and no paths are renamed. The problems and
+their short names are as follows:
 
-          equal      Original path and new path are the same.
-          missing    Original path does not exist.
-          existing   New path already exists.
-          colliding  Two or more new paths are the same.
-          parent     Parent directory of new path does not exist.
+  equal      Original path and new path are the same.
+  missing    Original path does not exist.
+  existing   New path already exists.
+  colliding  Two or more new paths are the same.
+  parent     Parent directory of new path does not exist.
 
-        Users can configure various problem controls to address such issues.
-        That allows the renaming plan to proceed in spite of the problems,
-        either by skipping offending items, taking remedial action (creating a
-        missing parent for a new path), or simply forging ahead in spite of the
-        consequences (clobbering).
+Users can configure various problem controls to address such issues.
+That allows the renaming plan to proceed in spite of the problems,
+either by skipping offending items, taking remedial action (creating a
+missing parent for a new path), or simply forging ahead in spite of the
+consequences (clobbering).
 
-        The controls and their applicable problems:
+The controls and their applicable problems:
 
-          skip     All of them.
-          create   parent.
-          clobber  existing, colliding.
+  skip     All of them.
+  create   parent.
+  clobber  existing, colliding.
 
-        Examples:
+Examples:
 
-          # Skipping items with specific problems.
-          --skip equal
-          --skip equal missing
+  # Skipping items with specific problems.
+  --skip equal
+  --skip equal missing
 
-          # Shortcut to control all applicable problems.
-          --skip all
-          --clobber all
+  # Shortcut to control all applicable problems.
+  --skip all
+  --clobber all
 
-          # Creating missing parents before renaming.
-          --create parent
-    ''').lstrip()
+  # Creating missing parents before renaming.
+  --create parent
+'''
 
     # Important key names in opts_config.
     names = 'names'
@@ -927,3 +932,48 @@ class CLI:
             )
             break
 
+    # Map each option name to its primary command-line form,
+    # for use in error messages. For example: rename => --rename.
+    flags = {
+        parse_oc_name(oc) : oc['names'].split()[0]
+        for oc in opts_config
+    }
+
+    # Freeze the configuration, now that it is complete. It is read
+    # when building the parser and when checking user preferences,
+    # but never modified.
+    opts_config = tuple(
+        MappingProxyType(oc)
+        for oc in opts_config
+    )
+
+####
+# The argparse parser. It is built from the configuration above on first
+# use, rather than at import, and then reused by every CliRenamer instance.
+####
+
+@lru_cache(maxsize = None)
+def get_arg_parser():
+    return create_arg_parser()
+
+def create_arg_parser():
+    # Define parser.
+    ap = argparse.ArgumentParser(
+        prog = CON.app_name,
+        description = CLI.description,
+        add_help = False,
+    )
+    # Add arguments, in argument-groups.
+    # The presense of CLI.group in the configuration dict (oc)
+    # signals the start of each new argument-group.
+    arg_group = None
+    for oc in CLI.opts_config:
+        kws = dict(oc)
+        kws.pop(CLI.dtype)
+        kws.pop(CLI.real_default, None)
+        if CLI.group in kws:
+            arg_group = ap.add_argument_group(kws.pop(CLI.group))
+        xs = kws.pop(CLI.names).split()
+        arg_group.add_argument(*xs, **kws)
+    # Return parser.
+    return ap
@@ -1,13 +1,14 @@
+import dis
+import os
 import re
-import sys
 import traceback
 
-from copy import deepcopy
-from dataclasses import asdict, replace as clone
-from itertools import groupby
-from os.path import commonprefix
+from collections import Counter
+from dataclasses import replace as clone
+from functools import lru_cache
+from os.path import commonprefix, exists, lexists
 from pathlib import Path
-from short_con import constants
+from types import CodeType
 
 from .utils import (
     MvsError,
@@ -15,6 +16,7 @@ from .utils import (
     MSG_FORMATS as MF,
     RenamePair,
     STRUCTURES,
+    constants,
 )
 
 from .problems import (
@@ -77,6 +79,8 @@ class RenamingPlan:
         self.seq_start = seq_start
         self.seq_step = seq_step
         self.prefix_len = 0
+        self.prefix_count = None
+        self.orig_paths = {}
 
         # Plan state.
         self.has_prepared = False
@@ -88,7 +92,8 @@ class RenamingPlan:
         self.file_sys = self.initialize_file_sys(file_sys)
 
         # Information used when checking RenamePair instance for problems.
-        self.new_groups = None
+        self.new_counts = None
+        self.parent_lookup = {}
 
         # Convert the problem-control inputs (skip, clobber, create)
         # into validated tuples of problem names.
@@ -149,33 +154,52 @@ class RenamingPlan:
         # Run various steps that process the RenamePair instances individually:
         # filtering, computing new paths, and validating.
         #
-        # We use the processed_rps() method to execute the step, handle
+        # We use the processed_rps() method to execute the steps, handle
         # problems appropriately, and yield a potentially-filtered collection
         # of potentially-modified RenamePair instances.
         #
+        # Steps grouped together are applied to each RenamePair in a single
+        # pass over self.rps. Computing the new path and the validation
+        # checks that look at one RenamePair at a time are grouped that way.
+        # Filtering gets its own pass because it changes the common prefix
+        # seen by the renaming code, and the collision check needs the full
+        # set of new paths.
+        #
+        # The user-supplied code might also use the common prefix of the
+        # original paths, so it is computed before those steps. Nothing
+        # after them needs it.
+        #
+        # Each preparation-step returns whether its steps need to run.
+        #
         rp_steps = (
-            (None, self.execute_user_filter),
-            (None, self.execute_user_rename),
-            (None, self.check_orig_exists),
-            (None, self.check_orig_new_differ),
-            (None, self.check_new_not_exists),
-            (None, self.check_new_parent_exists),
-            (self.prepare_new_groups, self.check_new_collisions),
+            (self.prepare_prefix_len, (self.execute_user_filter,)),
+            (self.prepare_prefix_len, (
+                self.execute_user_rename,
+                self.check_orig_exists,
+                self.check_orig_new_differ,
+                self.check_new_not_exists,
+                self.check_new_parent_exists,
+            )),
+            (self.prepare_new_counts, (self.check_new_collisions,)),
         )
-        for prep_step, step in rp_steps:
-            # Run any needed preparations and then the step.
-            if prep_step:
-                prep_step()
-            self.rps = tuple(self.processed_rps(step))
+        for prep_step, steps in rp_steps:
+            # Run any needed preparations and then the steps.
+            if prep_step and not prep_step():
+                continue
+            self.rps = tuple(self.processed_rps(*steps))
 
-            # Register problem if the step filtered out everything.
+            # Register problem if the steps filtered out everything.
             if not self.rps:
                 p = Problem(PN.all_filtered)
                 self.handle_problem(p)
 
             # Stop if the plan has failed either directly or via filtering.
             if self.failed:
-                return
+                break
+
+        # Drop any Paths kept for the user code, such as those
+        # of RenamePair instances that the filtering excluded.
+        self.orig_paths.clear()
 
     ####
     # Parsing inputs to obtain the original and, in some cases, new paths.
@@ -203,47 +227,20 @@ class RenamingPlan:
             else:
                 return do_fail(PN.parsing_no_paths)
 
-        # Otherwise, organize inputs into original paths and new paths.
-        if self.structure == STRUCTURES.paragraphs:
-            # Paragraphs: first original paths, then new paths.
-            # - Group into non-empty vs empty lines.
-            # - Ensure exactly two groups of non-empty.
-            groups = [
-                list(lines)
-                for g, lines in groupby(self.inputs, key = bool)
-                if g
-            ]
-            if len(groups) == 2:
-                origs, news = groups
-            else:
-                return do_fail(PN.parsing_paragraphs)
-
-        elif self.structure == STRUCTURES.pairs:
-            # Pairs: original path, new path, original path, etc.
-            groups = [[], []]
-            for i, line in enumerate(self.inputs):
-                if line:
-                    groups[i % 2].append(line)
-            origs, news = groups
-
-        elif self.structure == STRUCTURES.rows:
-            # Rows: original-new path pairs, as tab-delimited rows.
-            origs = []
-            news = []
-            for row in self.inputs:
-                if row:
-                    cells = row.split(CON.tab)
-                    if len(cells) == 2 and all(cells):
-                        origs.append(cells[0])
-                        news.append(cells[1])
-                    else:
-                        return do_fail(PN.parsing_row, row)
-
+        # Otherwise, organize inputs into original paths and new paths,
+        # using the parser for the input structure.
+        parsers = {
+            STRUCTURES.paragraphs: self.parse_paragraphs,
+            STRUCTURES.pairs: self.parse_pairs,
+            STRUCTURES.rows: self.parse_rows,
+        }
+        parse = parsers.get(self.structure, self.parse_flat)
+        result = parse(self.inputs)
+        if isinstance(result, Problem):
+            self.handle_problem(result)
+            return ()
         else:
-            # Flat: like paragraphs without the blank-line delimiter.
-            paths = [line for line in self.inputs if line]
-            i = len(paths) // 2
-            origs, news = (paths[0:i], paths[i:])
+            origs, news = result
 
         # Problem if we got no paths or unequal original vs new.
         if not origs and not news:
@@ -257,6 +254,68 @@ class RenamingPlan:
             for orig, new in zip(origs, news)
         )
 
+    ####
+    # Parsers for the input structures.
+    #
+    # Each takes the input lines and returns either a Problem
+    # or a tuple of (original paths, new paths).
+    ####
+
+    def parse_paragraphs(self, lines):
+        # Paragraphs: first original paths, then new paths.
+        # - Walk forward to find the bounds of the first two runs
+        #   of non-empty lines: lines[i:j] and lines[k:m].
+        # - Ensure that both runs exist and nothing but
+        #   empty lines follows the second.
+        n = len(lines)
+        i = 0
+        while i < n and not lines[i]:
+            i += 1
+        j = i
+        while j < n and lines[j]:
+            j += 1
+        k = j
+        while k < n and not lines[k]:
+            k += 1
+        m = k
+        while m < n and lines[m]:
+            m += 1
+        if i == j or k == m or any(lines[m:]):
+            return Problem(PN.parsing_paragraphs)
+        else:
+            return (lines[i:j], lines[k:m])
+
+    def parse_pairs(self, lines):
+        # Pairs: original path, new path, original path, etc.
+        # Empty lines are ignored, so they do not affect
+        # whether a line counts as original or new.
+        paths = list(filter(None, lines))
+        return (paths[0::2], paths[1::2])
+
+    def parse_rows(self, lines):
+        # Rows: original-new path pairs, as tab-delimited rows.
+        # Each row must have exactly two non-empty cells.
+        tab = CON.tab
+        origs = []
+        news = []
+        add_orig = origs.append
+        add_new = news.append
+        for row in lines:
+            if row:
+                orig, sep, new = row.partition(tab)
+                if orig and new and tab not in new:
+                    add_orig(orig)
+                    add_new(new)
+                else:
+                    return Problem(PN.parsing_row, row)
+        return (origs, news)
+
+    def parse_flat(self, lines):
+        # Flat: like paragraphs without the blank-line delimiter.
+        paths = list(filter(None, lines))
+        i = len(paths) // 2
+        return (paths[0:i], paths[i:])
+
     ####
     # Creating the user-defined functions for filtering and renaming.
     ####
@@ -271,25 +330,9 @@ class RenamingPlan:
         if callable(user_code):
             return user_code
 
-        # Define the text of the code.
-        func_name = CON.func_name_fmt.format(action)
-        code = CON.user_code_fmt.format(
-            func_name = func_name,
-            user_code = user_code,
-            indent = ' ' * self.indent,
-        )
-
-        # Create the function via exec() in the context of:
-        # - Globals that we want to make available to the user's code.
-        # - A locals dict that we can use to return the generated function.
-        globs = dict(
-            re = re,
-            Path = Path,
-        )
-        locs = {}
+        # Build the function, reporting any error as a Problem.
         try:
-            exec(code, globs, locs)
-            return locs[func_name]
+            return build_user_func(action, user_code, self.indent)
         except Exception as e:
             msg = traceback.format_exc(limit = 0)
             p = Problem(PN.user_code_exec, msg)
@@ -300,19 +343,16 @@ class RenamingPlan:
     # A method to execute the steps that process RenamePair instance individually.
     ####
 
-    def processed_rps(self, step):
-        # Takes a "step", which is a RenamingPlan method.
-        # Executes that method for each RenamePair.
+    def processed_rps(self, *steps):
+        # Takes one or more "steps", which are RenamingPlan methods.
+        # Executes those methods, in order, for each RenamePair.
         # Yields potentially-modified RenamePair instances,
         # handling problems along the way.
 
-        # Prepare common-prefix and sequence numbering, which might
-        # be used by the user-suppled renaming/filtering code.
-        self.prefix_len = self.compute_prefix_len()
-        seq = self.compute_sequence_iterator()
-
-        for rp in self.rps:
-            # The step() call returns a potentially-modified
+        # Pair each RenamePair with its sequence number, which might be
+        # used by the user-suppled renaming/filtering code.
+        for rp, seq_val in zip(self.rps, self.sequence_values()):
+            # Each step() call returns a potentially-modified
             # RenamePair instance or a Problem instance.
             #
             # - orig: never modified.
@@ -321,28 +361,38 @@ class RenamingPlan:
             # - create_parent: can be set here if a controlled problem occurred.
             # - clobber: ditto.
             #
-
-            # Execute the step. If we get a Problem, handle it.
-            # Otherwise, set rp to the returned RenamePair.
-            result = step(rp, next(seq))
-            if isinstance(result, Problem):
-                control = self.handle_problem(result, rp = rp)
-            else:
-                control = None
-                rp = result
-
-            # Act based on the problem-control and the rp.
-            if control == CONTROLS.skip:
-                # Skip RenamePair because a problem occurred, but proceed with others.
-                continue
-            elif control == CONTROLS.clobber:
-                # During renaming, the RenamePair will overwrite something.
-                yield clone(rp, clobber = True)
-            elif control == CONTROLS.create:
-                # The RenamePair lacks a parent, but we will create it before renaming.
-                yield clone(rp, create_parent = True)
-            elif not rp.exclude:
-                # No problem: yield unless filtered out by user's code.
+            keep = True
+            for step in steps:
+                # Execute the step. If we get a Problem, handle it.
+                # Otherwise, set rp to the returned RenamePair.
+                result = step(rp, seq_val)
+                if isinstance(result, Problem):
+                    control = self.handle_problem(result, rp = rp)
+                else:
+                    control = None
+                    rp = result
+
+                # Act based on the problem-control and the rp.
+                if control == CONTROLS.skip:
+                    # Skip RenamePair because a problem occurred, but proceed with others.
+                    keep = False
+                    break
+                elif control == CONTROLS.clobber:
+                    # During renaming, the RenamePair will overwrite something.
+                    rp = clone(rp, clobber = True)
+                elif control == CONTROLS.create:
+                    # The RenamePair lacks a parent, but we will create it before renaming.
+                    rp = clone(rp, create_parent = True)
+                elif rp.exclude:
+                    # Filtered out by user's code.
+                    keep = False
+                    break
+                elif result is not rp:
+                    # An uncontrolled problem: the plan has failed,
+                    # so the remaining steps are moot.
+                    break
+
+            if keep:
                 yield rp
 
     ####
@@ -351,10 +401,27 @@ class RenamingPlan:
     # a modified RenamePair.
     ####
 
+    def orig_path_arg(self, func, orig, keep):
+        # Takes a function for user code, an original path, and whether to
+        # keep the Path for a later step. Returns the Path argument for the
+        # function, or None if the function is known not to use it.
+        # Functions supplied directly by the user always get it. The
+        # filtering step keeps each Path it builds, and the renaming step
+        # takes it back out, so the memo only holds Paths between the two.
+        if getattr(func, 'uses_path', True):
+            p = self.orig_paths.pop(orig, None) or Path(orig)
+            if keep:
+                self.orig_paths[orig] = p
+            return p
+        else:
+            return None
+
     def execute_user_filter(self, rp, seq_val):
         if self.filter_code:
             try:
-                result = self.filter_func(rp.orig, Path(rp.orig), seq_val, self)
+                f = self.filter_func
+                p = self.orig_path_arg(f, rp.orig, True)
+                result = f(rp.orig, p, seq_val, self)
                 return rp if result else clone(rp, exclude = True)
             except Exception as e:
                 return Problem(PN.filter_code_invalid, e, rp.orig)
@@ -365,12 +432,19 @@ class RenamingPlan:
         if self.rename_code:
             # Compute the new path.
             try:
-                new = self.rename_func(rp.orig, Path(rp.orig), seq_val, self)
+                f = self.rename_func
+                p = self.orig_path_arg(f, rp.orig, False)
+                new = f(rp.orig, p, seq_val, self)
             except Exception as e:
                 return Problem(PN.rename_code_invalid, e, rp.orig)
-            # Validate its type and return a modified RenamePair instance.
-            if isinstance(new, (str, Path)):
-                return clone(rp, new = str(new))
+            # Validate its type and return a new RenamePair instance. This
+            # step runs before anything can set the other RenamePair
+            # attributes, so we construct it directly: that is much
+            # cheaper than clone(), and every rp goes through here.
+            if isinstance(new, str):
+                return RenamePair(rp.orig, new)
+            elif isinstance(new, Path):
+                return RenamePair(rp.orig, str(new))
             else:
                 typ = type(new).__name__
                 return Problem(PN.rename_code_bad_return, typ, rp.orig)
@@ -399,21 +473,28 @@ class RenamingPlan:
             return rp
 
     def check_new_parent_exists(self, rp, seq_val):
-        if self.path_exists(Path(rp.new).parent):
+        # New paths often share a parent directory, so we remember
+        # the outcome of each parent check rather than repeating it.
+        # The parent is not normalized: collapsing '..' as text would
+        # skip over directories that the renaming will need.
+        parent = str(Path(rp.new).parent)
+        lookup = self.parent_lookup
+        if parent not in lookup:
+            lookup[parent] = self.path_exists(parent, follow_links = True)
+        if lookup[parent]:
             return rp
         else:
             return Problem(PN.parent)
 
-    def prepare_new_groups(self):
+    def prepare_new_counts(self):
         # A preparation-step for check_new_collisions().
-        # Organize rps into dict-of-list, keyed by the new path.
-        self.new_groups = {}
-        for rp in self.rps:
-            self.new_groups.setdefault(rp.new, []).append(rp)
+        # Count how many rps share each new path. If every
+        # new path is distinct, the check can be skipped.
+        self.new_counts = Counter(rp.new for rp in self.rps)
+        return len(self.new_counts) < len(self.rps)
 
     def check_new_collisions(self, rp, seq_val):
-        g = self.new_groups[rp.new]
-        if len(g) == 1:
+        if self.new_counts[rp.new] == 1:
             return rp
         else:
             return Problem(PN.colliding)
@@ -473,11 +554,13 @@ class RenamingPlan:
         # Takes a Problem and optionally a RenamePair.
         #
         # - Determines whether a problem-control is active for the problem type.
-        # - Stores a new Problem containing original Problem info, plus the RenamePair.
+        # - Stores a new Problem containing original Problem info, plus the
+        #   RenamePair. Without a RenamePair, the original Problem will do.
         # - Returns the control (which might be None).
         #
-        control = self.control_lookup.get(p.name, None)
-        p = Problem(p.name, msg = p.msg, rp = rp)
+        control = self.control_lookup.get(p.name)
+        if rp is not None:
+            p = Problem(p.name, msg = p.msg, rp = rp)
         self.problems[control].append(p)
         return control
 
@@ -494,12 +577,36 @@ class RenamingPlan:
     # Sequence number and common prefix.
     ####
 
-    def compute_sequence_iterator(self):
-        return iter(range(self.seq_start, sys.maxsize, self.seq_step))
+    def sequence_values(self):
+        # A range bounded by the number of rps, so that negative
+        # steps work too.
+        start = self.seq_start
+        step = self.seq_step
+        return range(start, start + len(self.rps) * step, step)
+
+    def prepare_prefix_len(self):
+        # A preparation-step for the steps running user-supplied code.
+        # Steps only ever remove rps, so if the count is unchanged since
+        # the last computation, so is the prefix.
+        n = len(self.rps)
+        if n != self.prefix_count:
+            self.prefix_len = self.compute_prefix_len()
+            self.prefix_count = n
+        return True
 
     def compute_prefix_len(self):
-        origs = tuple(rp.orig for rp in self.rps)
-        return len(commonprefix(origs))
+        # Narrow a running prefix, one original path at a time. Paths
+        # that already start with the prefix need no further work, and
+        # we can stop once the prefix is empty.
+        if not self.rps:
+            return 0
+        prefix = self.rps[0].orig
+        for rp in self.rps:
+            if not rp.orig.startswith(prefix):
+                prefix = commonprefix((prefix, rp.orig))
+                if not prefix:
+                    break
+        return len(prefix)
 
     def strip_prefix(self, orig):
         i = self.prefix_len
@@ -515,11 +622,12 @@ class RenamingPlan:
         # to hold additional information.
         #
         # We build an independent copy of the file system because
-        # the rename_paths() method will modify the dict.
+        # the rename_paths() method will modify the dict. It only adds,
+        # removes, and moves entries, so a shallow copy suffices.
         if file_sys is None:
             return None
         elif isinstance(file_sys, dict):
-            return deepcopy(file_sys)
+            return dict(file_sys)
         else:
             try:
                 return {
@@ -529,16 +637,16 @@ class RenamingPlan:
             except Exception as e:
                 raise MvsError.new(e, msg = MF.invalid_file_sys)
 
-    def path_exists(self, p):
+    def path_exists(self, p, follow_links = False):
         if self.file_sys is None:
-            # Check the real file system.
-            return Path(p).exists()
+            # Check the real file system. By default, a symlink exists even
+            # if its target does not, because renaming acts on the link.
+            return exists(p) if follow_links else lexists(p)
         else:
             # Or check the fake file system added for testing purposes.
             # In this context, assume that '.' always exists so that the
             # user/tester does not have to include explicitly.
-            p = str(p)
-            return p in self.file_sys or p == '.'
+            return p in self.file_sys or p == CON.period
 
     def rename_paths(self):
         # Don't rename more than once.
@@ -571,12 +679,12 @@ class RenamingPlan:
         # Rename.
         if use_real_fs:
             if rp.create_parent:
-                Path(rp.new).parent.mkdir(parents = True, exist_ok = True)
-            p = Path(rp.orig)
+                # The same parent that check_new_parent_exists() looked for.
+                os.makedirs(Path(rp.new).parent, exist_ok = True)
             if rp.clobber:
-                p.replace(rp.new)
+                os.replace(rp.orig, rp.new)
             else:
-                p.rename(rp.new)
+                os.rename(rp.orig, rp.new)
         else:
             if rp.create_parent:
                 for par in Path(rp.new).parents:
@@ -617,13 +725,93 @@ class RenamingPlan:
             # Other.
             prefix_len = self.prefix_len,
             rename_pairs = [
-                asdict(rp)
+                rp.as_dict
                 for rp in self.rps
             ],
             tracking_index = self.tracking_index,
             problems = {
-                control : [asdict(p) for p in ps]
+                control : [p.as_dict for p in ps]
                 for control, ps in self.problems.items()
             },
         )
 
+####
+# Compiling user-supplied code.
+####
+
+# Globals that we want to make available to the user's code.
+USER_CODE_GLOBALS = dict(
+    re = re,
+    Path = Path,
+)
+
+# The argument of user code that holds the original path as a Path.
+USER_CODE_PATH_ARG = 'p'
+
+# Prefixes of the bytecode operations that can run other code: calls of
+# any kind (the names vary across Python versions) and imports.
+USER_CODE_CALL_OPS = ('CALL', 'IMPORT_NAME')
+
+@lru_cache(maxsize = 128)
+def compile_user_code(action, user_code, indent):
+    # Takes a CON.code_actions name, the text of the user's code, and
+    # the indent size. Returns the compiled code object that defines the
+    # function, plus whether the function might use its Path argument.
+    # Results are cached, so plans using the same code only compile it
+    # and inspect it once.
+
+    # Define the text of the code.
+    func_name = CON.func_name_fmt.format(action)
+    code = CON.user_code_fmt.format(
+        func_name = func_name,
+        user_code = user_code,
+        indent = ' ' * indent,
+    )
+
+    # Compile the code and find the code object of the function it defines.
+    code_obj = compile(code, f'<{action}_code>', 'exec')
+    func_code = next(
+        c
+        for c in code_obj.co_consts
+        if getattr(c, 'co_name', None) == func_name
+    )
+    return (code_obj, uses_name(func_code, USER_CODE_PATH_ARG))
+
+def build_user_func(action, user_code, indent):
+    # Takes the same arguments as compile_user_code(). Returns a new
+    # function for the user's code.
+    code_obj, uses_path = compile_user_code(action, user_code, indent)
+
+    # Execute the compiled code in the context of:
+    # - A fresh copy of the globals that we want to make available to the
+    #   user's code. Each function gets its own, so that nothing the code
+    #   does to its globals can reach another plan, even one with the
+    #   same code.
+    # - A locals dict that we can use to return the generated function.
+    locs = {}
+    exec(code_obj, dict(USER_CODE_GLOBALS), locs)
+    func = locs[CON.func_name_fmt.format(action)]
+
+    # Note whether the function might use its Path argument.
+    func.uses_path = uses_path
+    return func
+
+def uses_name(code_obj, name):
+    # Takes a code object and a variable name. Returns true if the code
+    # might use the variable. The check errs on the side of true: any
+    # instruction mentioning the name counts, as does a closure over it.
+    # So does any call or import, because the code being run could reach
+    # the variable through a stack frame, as breakpoint() or
+    # sys._getframe() can. Code nested in the code, such as a lambda, is
+    # checked the same way.
+    if name in code_obj.co_cellvars:
+        return True
+    for ins in dis.get_instructions(code_obj):
+        arg = ins.argval
+        if ins.opname.startswith(USER_CODE_CALL_OPS):
+            return True
+        elif arg == name or (isinstance(arg, tuple) and name in arg):
+            return True
+        elif isinstance(arg, CodeType) and uses_name(arg, name):
+            return True
+    return False
@@ -1,7 +1,6 @@
 from dataclasses import dataclass, field
-from short_con import constants, cons
 
-from .utils import RenamePair
+from .utils import RenamePair, SLOTS, constants
 
 ####
 # Problem names and associated messages/formats.
@@ -67,7 +66,7 @@ CONTROLLABLES = {
 # Data object to represent a problem.
 ####
 
-@dataclass(init = False, frozen = True)
+@dataclass(init = False, frozen = True, **SLOTS)
 class Problem:
     name: str
     msg: str
@@ -76,11 +75,12 @@ class Problem:
     def __init__(self, name, *xs, msg = None, rp = None):
         # Custom initializer, because we need a convenience lookup to build
         # the ultimate message, given a problem name and arguments.
-        # To keep Problem instances frozen, we modify __dict__ directly.
-        d = self.__dict__
-        d['name'] = name
-        d['msg'] = msg or self.format_for(name).format(*xs)
-        d['rp'] = rp
+        # To keep Problem instances frozen, we bypass the
+        # dataclass __setattr__ and set the attributes directly.
+        set_attr = object.__setattr__
+        set_attr(self, 'name', name)
+        set_attr(self, 'msg', msg or self.format_for(name).format(*xs))
+        set_attr(self, 'rp', rp)
 
     @property
     def formatted(self):
@@ -89,6 +89,15 @@ class Problem:
         else:
             return f'{self.msg}:\n{self.rp.formatted}'
 
+    @property
+    def as_dict(self):
+        rp = self.rp
+        return dict(
+            name = self.name,
+            msg = self.msg,
+            rp = None if rp is None else rp.as_dict,
+        )
+
     @classmethod
     def format_for(cls, name):
         return PROBLEM_FORMATS[name]
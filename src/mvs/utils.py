@@ -1,16 +1,75 @@
-import pyperclip
+import sys
 
 from dataclasses import dataclass
 from kwexception import Kwexception
 from pathlib import Path
-from short_con import constants
 from subprocess import run
 from tempfile import gettempdir
-from textwrap import dedent
 from time import time
 
 from .version import __version__
 
+####
+# Read-only containers of constants.
+#
+# The constants() function returns an instance of a class that holds the
+# constants as class attributes, so attribute lookups are plain class
+# attribute reads and instances have no state to modify. The class also
+# supports a few read-only dict behaviors: keys(), values(), get(), lookup
+# by name via [], iteration over the names, and membership tests against
+# the names.
+####
+
+class Constants:
+
+    __slots__ = ()
+    _fields = ()
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(getattr(self, nm) for nm in self._fields)
+
+    def get(self, name, default = None):
+        return getattr(self, name) if name in self._fields else default
+
+    def __getitem__(self, name):
+        if name in self._fields:
+            return getattr(self, name)
+        else:
+            raise KeyError(name)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        pairs = ', '.join(f'{nm}={getattr(self, nm)!r}' for nm in self._fields)
+        return f'{type(self).__name__}({pairs})'
+
+def constants(name, attrs):
+    # Takes a class name and either (a) a dict mapping constant names to
+    # values or (b) a sequence of names, each of which is its own value.
+    # Returns the frozen container.
+    if isinstance(attrs, dict):
+        d = dict(attrs)
+    else:
+        d = {nm : nm for nm in attrs}
+    clashes = tuple(nm for nm in d if nm.startswith('_') or hasattr(Constants, nm))
+    if clashes:
+        raise ValueError(f'Invalid constant names: {clashes}')
+    # Each value is wrapped in staticmethod(), so that functions and
+    # other descriptors come back as themselves rather than being bound.
+    ns = {nm : staticmethod(val) for nm, val in d.items()}
+    cls = type(name, (Constants,), dict(ns, __slots__ = (), _fields = tuple(d)))
+    return cls()
+
 ####
 # General constants.
 ####
@@ -89,6 +148,7 @@ MSG_FORMATS = constants('MsgFormats', dict(
     invalid_pref_val       = 'User preferences: invalid value for {}: expected {}: got {!r}',
     invalid_pref_keys      = 'User preferences: invalid key(s): {}',
     no_editor              = 'The --edit option requires an --editor',
+    no_clipboard           = 'The --clipboard option is unavailable: {}',
     editor_cmd_nonzero     = 'Editor process exited unsuccessfully: editor={!r}, path={!r}',
     edit_failed_unexpected = 'Editing failed unexpectedly. Traceback follows:\n\n{}',
     # Other messages in CliRenamer.
@@ -106,11 +166,18 @@ MSG_FORMATS = constants('MsgFormats', dict(
 class MvsError(Kwexception):
     pass
 
+####
+# Dataclasses for the data objects created in bulk (one or more per input
+# path) use __slots__ where the Python version supports it.
+####
+
+SLOTS = dict(slots = True) if sys.version_info >= (3, 10) else {}
+
 ####
 # A dataclass to hold a pair of paths: original and corresponding new.
 ####
 
-@dataclass(frozen = True)
+@dataclass(frozen = True, **SLOTS)
 class RenamePair:
     # A data object to hold an original path and the corresponding new path.
     orig: str
@@ -127,13 +194,26 @@ class RenamePair:
     def formatted(self):
         return f'{self.orig}\n{self.new}\n'
 
+    @property
+    def as_dict(self):
+        # Equivalent to dataclasses.asdict(), without its
+        # field-introspection and recursion.
+        return dict(
+            orig = self.orig,
+            new = self.new,
+            exclude = self.exclude,
+            create_parent = self.create_parent,
+            clobber = self.clobber,
+        )
+
 ####
 # Read/write: files, clipboard.
 ####
 
 def read_from_file(path):
+    # Yields the lines of a file, without reading it all at once.
     with open(path) as fh:
-        return fh.read()
+        yield from fh
 
 def edit_text(editor, text):
     # Get a temp file path that does not exist.
@@ -159,10 +239,20 @@ def edit_text(editor, text):
     else:
         raise MvsError(MSG_FORMATS.editor_cmd_nonzero.format(editor, path))
 
+# The clipboard functions import pyperclip only when called. It is a
+# relatively costly import, and most runs never touch the clipboard.
+
 def read_from_clipboard():
-    return pyperclip.paste()
+    # Fail with a plain message, rather than a traceback, if pyperclip
+    # cannot find a copy/paste mechanism on the system.
+    import pyperclip
+    try:
+        return pyperclip.paste()
+    except pyperclip.PyperclipException as e:
+        raise MvsError(MSG_FORMATS.no_clipboard.format(e))
 
 def write_to_clipboard(text):
+    import pyperclip
     pyperclip.copy(text)
 
 ####
@@ -173,6 +263,8 @@ def write_to_clipboard(text):
 ####
 
 def positive_int(x):
+    # The isdigit() check rejects forms that int() would accept,
+    # such as '+2', ' 2', and '1_0'.
     if x.isdigit():
         x = int(x)
         if x >= 1:
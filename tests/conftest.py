@@ -7,7 +7,9 @@ from pathlib import Path
 
 @pytest.fixture
 def tr():
-    return TestResource()
+    # Remove the work area, if a test created one, when the test ends.
+    yield TestResource()
+    shutil.rmtree(TestResource.WORK_AREA_ROOT, ignore_errors = True)
 
 class TestResource(object):
 
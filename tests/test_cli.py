@@ -1,8 +1,8 @@
 
 import json
+import pyperclip
 import pytest
 import re
-import sys
 
 from io import StringIO
 from pathlib import Path
@@ -130,7 +130,7 @@ def test_indent_and_posint(tr):
         assert cli.out
 
     # Invalid indent values.
-    for i in ('-4', 'xx', '0', '1.2'):
+    for i in ('-4', 'xx', '0', '1.2', '+2', ' 2', '1_0'):
         cli = CliRenamerSIO(*args, i, *origs, file_sys = origs, yes = True)
         cli.run()
         assert cli.failure
@@ -246,7 +246,7 @@ def test_odd_number_inputs(tr):
     assert got.startswith(exp1)
     assert exp2 in got
 
-def test_sources(tr):
+def test_sources(tr, monkeypatch):
     # Paths and args.
     origs = ('z1', 'z2', 'z3')
     news = ('A1', 'A2', 'A3')
@@ -263,11 +263,14 @@ def test_sources(tr):
     cli = CliRenamerSIO(*args, yes, file_sys = origs)
     do_checks(cli)
 
-    # Paths via clipboard.
-    if can_use_clipboard():
-        write_to_clipboard(args_txt)
-        cli = CliRenamerSIO('--clipboard', yes, file_sys = origs)
-        do_checks(cli)
+    # Paths via clipboard. A fake clipboard keeps this scenario
+    # independent of the copy/paste mechanisms on the system.
+    clipboard = dict(text = '')
+    monkeypatch.setattr(pyperclip, 'copy', lambda text: clipboard.update(text = text))
+    monkeypatch.setattr(pyperclip, 'paste', lambda: clipboard['text'])
+    write_to_clipboard(args_txt)
+    cli = CliRenamerSIO('--clipboard', yes, file_sys = origs)
+    do_checks(cli)
 
     # Paths via stdin.
     cli = CliRenamerSIO('--stdin', yes, file_sys = origs, replies = args_txt)
@@ -289,16 +292,29 @@ def test_sources(tr):
     assert '--clipboard' in cli.err
     assert '--stdin' in cli.err
 
-def can_use_clipboard():
-    # I could not get pyperclip working on ubuntu in Github Actions,
-    # I'm using this to bypass clipboard checks.
-    return sys.platform != 'linux'
+def test_clipboard_line_splitting(tr, monkeypatch):
+    # Clipboard text is split only on newlines, as with files and stdin,
+    # so paths can contain other line-breaking characters.
+    origs = ('a\u2028b',)
+    news = ('c\x1cd',)
+    text = CON.newline.join(origs + news) + '\r\n'
+    monkeypatch.setattr(pyperclip, 'paste', lambda: text)
+    cli = CliRenamerSIO('--clipboard', '--yes', file_sys = origs)
+    cli.run()
+    assert cli.success
+    cli.check_file_sys(*news)
 
-    # try:
-    #     write_to_clipboard('blort')
-    #     return True
-    # except Exception:
-    #     return False
+def test_clipboard_unavailable(tr, monkeypatch):
+    # If pyperclip has no copy/paste mechanism, the CLI
+    # fails with a message rather than a traceback.
+    def paste():
+        raise pyperclip.PyperclipException('NO_MECHANISM')
+    monkeypatch.setattr(pyperclip, 'paste', paste)
+    cli = CliRenamerSIO('--clipboard', '--yes')
+    cli.run()
+    assert cli.failure
+    assert cli.out == ''
+    assert cli.err == MF.no_clipboard.format('NO_MECHANISM') + CON.newline
 
 ####
 # Dryrun and no-confirmation.
@@ -321,6 +337,29 @@ def test_dryrun(tr):
     exp = tr.OUTS['listing_a2aa'] + tr.OUTS['no_action']
     assert got == exp
 
+def test_limit(tr):
+    # The listing honors --limit, while the counts reflect all paths.
+    origs = ('a', 'b', 'c')
+    cli = CliRenamerSIO(
+        '--rename',
+        'return o + o',
+        '--dryrun',
+        '--limit',
+        '2',
+        *origs,
+        file_sys = origs,
+    )
+    cli.run()
+    assert cli.success
+    assert cli.out.startswith('Paths to be renamed (total 3, listed 2).')
+    assert 'b\nbb\n' in cli.out
+    assert 'c\ncc\n' not in cli.out
+
+    # The header of a listing ends with a newline, even with no items.
+    rps = cli.plan.rps
+    assert cli.listing_msg('Items{}.', rps[0:0]) == 'Items (total 0, listed 2).\n'
+    assert cli.listing_msg('Items{}.', rps[0:1]) == 'Items (total 1, listed 2).\na\naa\n'
+
 def test_no_confirmation(tr):
     origs = ('a', 'b', 'c')
     cli = CliRenamerSIO(
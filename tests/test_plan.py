@@ -1,10 +1,15 @@
+import os
 import pytest
+import sys
+
 from itertools import chain
+from pathlib import Path
 
 # Top-level package imports.
 from mvs import RenamingPlan, MvsError, __version__
 
 # Imports for testing.
+from mvs.plan import USER_CODE_GLOBALS
 from mvs.utils import CON, STRUCTURES, MSG_FORMATS as MF
 from mvs.problems import (
     CONTROLLABLES,
@@ -107,6 +112,16 @@ def test_structure_paragraphs(tr):
         plan.rename_paths()
     assert_failed_because(einfo, plan, PN.parsing_paragraphs)
 
+    # Just one paragraph.
+    plan = RenamingPlan(
+        inputs = empty + origs + news + empty,
+        structure = STRUCTURES.paragraphs,
+        file_sys = origs,
+    )
+    with pytest.raises(MvsError) as einfo:
+        plan.rename_paths()
+    assert_failed_because(einfo, plan, PN.parsing_paragraphs)
+
 def test_structure_pairs(tr):
     # Paths.
     origs = ('a', 'b', 'c')
@@ -133,6 +148,15 @@ def test_structure_pairs(tr):
     plan.rename_paths()
     assert tuple(plan.file_sys) == news
 
+    # Including a single empty line within a pair.
+    plan = RenamingPlan(
+        inputs = inputs[:3] + ('',) + inputs[3:],
+        structure = STRUCTURES.pairs,
+        file_sys = origs,
+    )
+    plan.rename_paths()
+    assert tuple(plan.file_sys) == news
+
     # Odd number of paths: should fail.
     plan = RenamingPlan(
         inputs = inputs[:-1],
@@ -192,6 +216,119 @@ def test_renaming_code(tr):
         plan.rename_paths()
         assert tuple(plan.file_sys) == news
 
+def test_code_compiled_once(tr):
+    # Plans given the same code text share the compiled code,
+    # but each gets its own function.
+    origs = ('a', 'b', 'c')
+    plans = [
+        RenamingPlan(
+            inputs = origs,
+            rename_code = 'return o + o',
+            file_sys = origs,
+        )
+        for _ in range(2)
+    ]
+    for plan in plans:
+        plan.prepare()
+    f1, f2 = (plan.rename_func for plan in plans)
+    assert f1 is not f2
+    assert f1.__code__ is f2.__code__
+    assert f1.__globals__ is not f2.__globals__
+
+def test_code_globals_isolated(tr):
+    # Globals set by one piece of user code are not visible to another.
+    origs = ('a', 'b', 'c')
+    plan = RenamingPlan(
+        inputs = origs,
+        rename_code = 'global LEAK; LEAK = 1; return o + o',
+        file_sys = origs,
+    )
+    plan.rename_paths()
+    plan = RenamingPlan(
+        inputs = origs,
+        rename_code = 'return o + str(LEAK)',
+        file_sys = origs,
+    )
+    plan.prepare()
+    assert plan.failed
+    assert plan.uncontrolled_problems[0].name == PN.rename_code_invalid
+    assert sorted(USER_CODE_GLOBALS) == ['Path', 're']
+
+    # Nor to a later plan with the same code.
+    origs = ('a', 'b')
+    news = ('a.1', 'b.2')
+    code = 'global n; n = globals().get("n", 0) + 1; return f"{o}.{n}"'
+    for _ in range(2):
+        plan = RenamingPlan(
+            inputs = origs,
+            rename_code = code,
+            file_sys = origs,
+        )
+        plan.rename_paths()
+        assert tuple(plan.file_sys) == news
+
+def test_code_path_arg(tr, monkeypatch):
+    # A breakpoint hook that records the Path seen by the debugger.
+    seen = []
+    def hook():
+        seen.append(sys._getframe(1).f_locals['p'])
+    monkeypatch.setattr(sys, 'breakpointhook', hook)
+
+    # The Path argument is built only for code that might use it.
+    origs = ('a.txt', 'b.txt')
+    checks = (
+        ('return o + o', False, ('a.txta.txt', 'b.txtb.txt')),
+        ('return p.stem', True, ('a', 'b')),
+        ('return o.upper()', True, ('A.TXT', 'B.TXT')),
+        ('breakpoint(); return o + "1"', True, ('a.txt1', 'b.txt1')),
+        (
+            'import sys; f = sys._getframe().f_locals; return f[chr(112)].stem',
+            True,
+            ('a', 'b'),
+        ),
+        (
+            'return (lambda: locals)()()[chr(112)].stem',
+            True,
+            ('a', 'b'),
+        ),
+    )
+    for code, exp_uses, exp_file_sys in checks:
+        plan = RenamingPlan(
+            inputs = origs,
+            rename_code = code,
+            file_sys = origs,
+        )
+        plan.rename_paths()
+        assert plan.rename_func.uses_path is exp_uses
+        assert tuple(plan.file_sys) == exp_file_sys
+
+    # The debugger saw the Path for each original path.
+    assert seen == [Path(o) for o in origs]
+
+def test_code_path_memo(tr):
+    # When both the filtering and renaming code use the Path argument,
+    # they get the same Path. None are kept after preparation, including
+    # those of paths that the filtering excluded.
+    origs = ('a', 'b', 'c')
+    seen = {}
+    def filter_func(o, p, seq, plan):
+        seen[o] = p
+        return o != 'b'
+    def rename_func(o, p, seq, plan):
+        assert p is seen[o]
+        return o + o
+    plan = RenamingPlan(
+        inputs = origs,
+        rename_code = rename_func,
+        filter_code = filter_func,
+        file_sys = origs,
+    )
+    plan.prepare()
+    assert not plan.failed
+    assert plan.orig_paths == {}
+    plan.rename_paths()
+    assert tuple(plan.file_sys) == ('b', 'aa', 'cc')
+
 def test_filtering_code(tr):
     # Basic use case: filter orig-paths with user-supplied code.
     origs = ('a', 'b', 'c', 'd', 'dd')
@@ -298,6 +435,20 @@ def test_seq(tr):
     plan.rename_paths()
     assert tuple(plan.file_sys) == news
 
+def test_seq_negative_step(tr):
+    # Sequence numbers can count down.
+    origs = ('a', 'b', 'c')
+    news = ('a.3', 'b.2', 'c.1')
+    plan = RenamingPlan(
+        inputs = origs,
+        rename_code = 'return f"{o}.{seq}"',
+        file_sys = origs,
+        seq_start = 3,
+        seq_step = -1,
+    )
+    plan.rename_paths()
+    assert tuple(plan.file_sys) == news
+
 def test_common_prefix(tr):
     # User-supplied code exercises strip_prefix() helper.
     origs = ('blah-a', 'blah-b', 'blah-c')
@@ -310,6 +461,17 @@ def test_common_prefix(tr):
     plan.rename_paths()
     assert tuple(plan.file_sys) == exp_file_sys
 
+    # The prefix used during renaming reflects only the
+    # original paths that survived filtering.
+    plan = RenamingPlan(
+        inputs = origs + ('zzz',),
+        rename_code = 'return plan.strip_prefix(o)',
+        filter_code = 'return o != "zzz"',
+        file_sys = origs + ('zzz',),
+    )
+    plan.rename_paths()
+    assert tuple(plan.file_sys) == ('zzz',) + exp_file_sys
+
 ####
 # RenamingPlan data.
 ####
@@ -592,6 +754,72 @@ def test_new_exists(tr):
     plan.rename_paths()
     assert tuple(plan.file_sys) == exp_file_sys[1:]
 
+@pytest.mark.skipif(sys.platform == 'win32', reason = 'Symlinks need privileges')
+def test_new_exists_as_broken_symlink(tr):
+    # Paths in the work area, plus a broken symlink at one new path.
+    origs, news = tr.temp_area(('a', 'b'), ('a1', 'b1'))
+    Path(news[0]).symlink_to('no-such-target')
+
+    # The symlink counts as existing: renaming would replace it.
+    plan = RenamingPlan(
+        inputs = origs + news,
+        structure = STRUCTURES.flat,
+    )
+    plan.prepare()
+    assert plan.failed
+    assert plan.uncontrolled_problems[0].name == PN.existing
+
+@pytest.mark.skipif(
+    sys.platform == 'win32',
+    reason = 'Windows collapses nodir\\.. without checking that nodir exists',
+)
+def test_new_parent_missing_before_dotdot(tr):
+    # A missing directory is a problem even when '..' follows it
+    # in the new path: the file system still has to traverse it.
+    origs, news = tr.temp_area(('a',), ('nodir/../a1',))
+    plan = RenamingPlan(
+        inputs = origs + news,
+        structure = STRUCTURES.flat,
+    )
+    plan.prepare()
+    assert plan.failed
+    assert plan.uncontrolled_problems[0].name == PN.parent
+
+def test_create_parent_before_dotdot(tr):
+    # With the create control, directories before a '..'
+    # in the new path are created too.
+    origs, news = tr.temp_area(('a',), ('x/sub/../a1',))
+    plan = RenamingPlan(
+        inputs = origs + news,
+        structure = STRUCTURES.flat,
+        create = PN.parent,
+    )
+    plan.rename_paths()
+    wa = tr.WORK_AREA_ROOT
+    assert Path(f'{wa}/x/sub').is_dir()
+    assert Path(f'{wa}/x/a1').is_file()
+
+def test_create_parent_of_directory(tr, monkeypatch):
+    # With the create control, a new directory path written with a
+    # trailing slash gets its parent created, not the path itself.
+    made = []
+    makedirs = os.makedirs
+    def record(p, *xs, **kws):
+        made.append(p)
+        return makedirs(p, *xs, **kws)
+    monkeypatch.setattr(os, 'makedirs', record)
+    origs, news = tr.temp_area(('d1/',), ('x/d2/',))
+    plan = RenamingPlan(
+        inputs = origs + news,
+        structure = STRUCTURES.flat,
+        create = PN.parent,
+    )
+    plan.rename_paths()
+    wa = tr.WORK_AREA_ROOT
+    assert [Path(p) for p in made] == [Path(wa, 'x')]
+    assert Path(f'{wa}/x/d2').is_dir()
+    assert not Path(f'{wa}/d1').exists()
+
 def test_new_parent_missing(tr):
     # Paths.
     origs = ('a', 'b', 'c')
@@ -701,3 +929,20 @@ def test_failures_skip_all(tr):
         plan.rename_paths()
     assert_failed_because(einfo, plan, PN.all_filtered)
 
+def test_failures_reported_together(tr):
+    # Paths: one original is missing and another equals its new path.
+    origs = ('a', 'b', 'c')
+    news = ('a1', 'b', 'c1')
+    file_sys = origs[1:]
+
+    # The per-RenamePair checks run in a single pass, so both
+    # problems are reported by the same prepare() call.
+    plan = RenamingPlan(
+        inputs = origs + news,
+        structure = STRUCTURES.flat,
+        file_sys = file_sys,
+    )
+    plan.prepare()
+    assert plan.failed
+    got = tuple((p.name, p.rp.orig) for p in plan.uncontrolled_problems)
+    assert got == ((PN.missing, 'a'), (PN.equal, 'b'))
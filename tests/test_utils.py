@@ -1,9 +1,72 @@
 import pytest
 
-from mvs.utils import RenamePair
+from dataclasses import asdict
+
+from mvs.problems import Problem, PROBLEM_NAMES as PN
+from mvs.utils import CON, RenamePair, SLOTS, constants
 
 def test_rename_pair(tr):
     rp = RenamePair('a', 'b')
     assert rp.orig == 'a'
     assert rp.new == 'b'
 
+def test_rename_pair_slots(tr):
+    # Where supported, RenamePair instances have no per-instance dict.
+    rp = RenamePair('a', 'b')
+    assert hasattr(rp, '__dict__') is not bool(SLOTS)
+
+def test_as_dict(tr):
+    # The hand-written as_dict properties agree with dataclasses.asdict().
+    rp = RenamePair('a', 'b', clobber = True)
+    assert rp.as_dict == asdict(rp)
+    for p in (Problem(PN.equal), Problem(PN.equal, rp = rp)):
+        assert p.as_dict == asdict(p)
+
+def test_user_code_fmt(tr):
+    # The template for user code is a plain literal: check the
+    # function source it produces.
+    code = CON.user_code_fmt.format(
+        func_name = '_do_rename',
+        user_code = 'return o',
+        indent = '  ',
+    )
+    assert code == 'def _do_rename(o, p, seq, plan):\n  return o\n'
+
+def test_constants(tr):
+    # From a sequence of names.
+    xs = constants('Xs', ('a', 'b'))
+    assert xs.a == 'a'
+    assert xs.keys() == ('a', 'b')
+    assert xs.values() == ('a', 'b')
+    assert 'b' in xs
+    assert 'keys' not in xs
+
+    # From a dict.
+    ys = constants('Ys', dict(a = 1, b = 2))
+    assert ys.b == 2
+    assert ys['a'] == 1
+    assert ys.get('b') == 2
+    assert ys.get('c', 99) == 99
+    with pytest.raises(KeyError):
+        ys['c']
+
+    # Frozen.
+    with pytest.raises(AttributeError):
+        ys.a = 3
+
+    # Callables and other descriptors are held as is.
+    zs = constants('Zs', dict(f = str.upper, g = len, p = property(len)))
+    assert zs.f is str.upper
+    assert zs.f('a') == 'A'
+    assert zs['g'] is len
+    assert isinstance(zs.p, property)
+    assert zs.values() == (str.upper, len, zs.p)
+
+    # Iteration yields the names, as with a dict.
+    assert tuple(ys) == ('a', 'b')
+    assert len(ys) == 2
+
+    # Names cannot shadow the container's own attributes.
+    for bad in ('keys', 'get', '_fields'):
+        with pytest.raises(ValueError):
+            constants('Zs', (bad,))